@@ -1,29 +1,128 @@
 import argparse
-import json
+import asyncio
+import atexit
+import base64
+import csv
+import hashlib
 import logging
+import logging.handlers
 import sys
 import time
 import os
+import queue
+import re
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
-import pandas as pd
-import requests
+import orjson
 import yaml
 from tqdm import tqdm
 
+# `httpx`, `pandas`, `pyarrow` and `requests` are imported inside the functions that
+# use them, so that config errors exit before paying for those (slow) imports.
+
 
 # --- Custom TQDM-Compatible Logger ---
-class TqdmLoggingHandler(logging.Handler):
+class TqdmLoggingHandler(logging.StreamHandler):
+    # Log lines go to stdout, bars to stderr: both paths below write to `self.stream`.
+    def __init__(self, stream=None):
+        super().__init__(stream or sys.stdout)
+
     def emit(self, record):
+        # Route through tqdm only while a bar is on screen; otherwise this is a plain
+        # StreamHandler (which already flushes once per record).
+        if not getattr(tqdm, "_instances", None):
+            super().emit(record)
+            return
         try:
-            msg = self.format(record)
-            tqdm.write(msg)
-            self.flush()
+            tqdm.write(self.format(record), file=self.stream)
         except Exception:
             self.handleError(record)
 
 
+# --- Progress bar with throttled redraws (hidden when stderr is not a terminal) ---
+def progress_bar(iterable=None, total=None, **kwargs):
+    return tqdm(
+        iterable,
+        total=total,
+        mininterval=0.5,
+        disable=not sys.stderr.isatty(),
+        **kwargs,
+    )
+
+
+# --- CSV rows parsed, prepared and patched per chunk ---
+CSV_CHUNK_ROWS = 100_000
+# Files up to this size are parsed in one multi-threaded pass; larger ones are streamed.
+CSV_IN_MEMORY_MAX_BYTES = 256 * 1024 * 1024
+
+# --- Concurrency limits for the async PATCH loop ---
+DEFAULT_MAX_CONCURRENT_REQUESTS = 32
+MAX_KEEPALIVE_CONNECTIONS = 8
+REQUEST_TIMEOUT = 30.0  # seconds; httpx defaults to 5
+ERROR_BODY_PREVIEW_BYTES = 512
+
+# --- Rate limiting / retry settings for the async PATCH loop ---
+INITIAL_REQUESTS_PER_SECOND = 10.0
+MIN_REQUESTS_PER_SECOND = 0.1  # floor for a recalibrated rate
+RATE_LIMIT_BURST = 10
+RATE_LIMIT_POLL_INTERVAL = 1.0  # seconds; longest single sleep while waiting for a token
+RATE_LIMIT_RESET_EPOCH_MIN = 1e9  # larger `X-RateLimit-Reset` values are epoch times
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5  # seconds
+BACKOFF_CAP = 30.0  # seconds
+
+
+# --- Token-bucket rate limiter, recalibrated from the server's rate-limit headers ---
+class RateLimiter:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last_refill = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.last_refill) * self.rate
+                )
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                # Sleep in short steps, so that a recalibrated (higher) rate applies
+                # to a wait that is already in progress.
+                await asyncio.sleep(
+                    min((1 - self.tokens) / self.rate, RATE_LIMIT_POLL_INTERVAL)
+                )
+
+    def recalibrate(self, headers):
+        # Spread the remaining quota (or the full limit) evenly until the window resets.
+        try:
+            quota = float(
+                headers.get("X-RateLimit-Remaining") or headers["X-RateLimit-Limit"]
+            )
+            reset = float(headers["X-RateLimit-Reset"])
+        except (KeyError, ValueError):
+            return
+        # `X-RateLimit-Reset` is either an epoch timestamp or seconds until reset.
+        window = reset - time.time() if reset > RATE_LIMIT_RESET_EPOCH_MIN else reset
+        if window <= 0:  # The window has already rolled over (or clocks disagree).
+            return
+        self.rate = max(max(quota, 1.0) / window, MIN_REQUESTS_PER_SECOND)
+
+
+def retry_after_seconds(headers):
+    try:
+        return max(float(headers.get("Retry-After", 0)), 0.0)
+    except ValueError:  # HTTP-date form; fall back to backoff only.
+        return 0.0
+
+
 # --- CLI argument parsing ---
 parser = argparse.ArgumentParser(
     description="Patch custom fields for use cases via Credo AI API."
@@ -45,45 +144,54 @@ CONFIG_PATH = args.config_path
 DRY_RUN = args.dry_run
 
 # --- Load config ---
+REQUIRED_KEYS = ("csv_path", "base_url", "api_token", "tenant", "custom_field_names")
+ENV_VAR_PATTERN = re.compile(r"\$\{([^}]+)\}")  # e.g. "${CREDO_AI_API_TOKEN}"
+
 try:
     with open(CONFIG_PATH, "r") as fin:
-        config = yaml.safe_load(fin)
+        config = yaml.safe_load(fin) or {}
 except FileNotFoundError:
     logging.error(f"Config file not found: {CONFIG_PATH}")
     sys.exit(1)
 
 # --- Perform basic input validation ---
-CSV_PATH = config.get("csv_path")
-BASE_URL = config.get("base_url")
-API_TOKEN = config.get("api_token")
+CSV_PATH, BASE_URL, API_TOKEN, TENANT, CUSTOM_FIELD_NAMES = map(
+    config.get, REQUIRED_KEYS
+)
 
 # --- Expand environment variables in auth token ---
-if API_TOKEN and API_TOKEN.startswith("${") and API_TOKEN.endswith("}"):
-    env_var = API_TOKEN[2:-1]
+env_var_match = (
+    ENV_VAR_PATTERN.fullmatch(API_TOKEN) if isinstance(API_TOKEN, str) else None
+)
+if env_var_match:
+    env_var = env_var_match.group(1)
     API_TOKEN = os.getenv(env_var)
     if not API_TOKEN:
         logging.error(f"Environment variable {env_var} not set")
         sys.exit(1)
-TENANT = config.get("tenant")
-CUSTOM_FIELD_NAMES = config.get("custom_field_names")
 NUM_IDS = config.get("num_ids")
-
-missing = []
-if not CSV_PATH:
-    missing.append("csv_path")
-if not BASE_URL:
-    missing.append("base_url")
-if not API_TOKEN:
-    missing.append("api_token")
-if not TENANT:
-    missing.append("tenant")
-if not CUSTOM_FIELD_NAMES:
-    missing.append("custom_field_names")
-elif not isinstance(CUSTOM_FIELD_NAMES, list) or not all(
-    isinstance(fld, str) for fld in CUSTOM_FIELD_NAMES
+BATCH_FIELDS = config.get("batch_fields") or False
+SKIP_UNCHANGED = config.get("skip_unchanged") or False
+MAX_CONCURRENT_REQUESTS = config.get("max_concurrent_requests")
+if MAX_CONCURRENT_REQUESTS is None:
+    MAX_CONCURRENT_REQUESTS = DEFAULT_MAX_CONCURRENT_REQUESTS
+
+# Only absent (or null) keys are missing. An empty value such as `api_token: ""` is
+# passed through as-is and rejected by whatever consumes it (e.g. the auth endpoint).
+missing = [
+    key
+    for key, value in zip(
+        REQUIRED_KEYS, (CSV_PATH, BASE_URL, API_TOKEN, TENANT, CUSTOM_FIELD_NAMES)
+    )
+    if value is None
+]
+if CUSTOM_FIELD_NAMES is not None and (
+    not CUSTOM_FIELD_NAMES
+    or not isinstance(CUSTOM_FIELD_NAMES, list)
+    or not set(map(type, CUSTOM_FIELD_NAMES)) <= {str}
 ):
     logging.error(
-        "The `custom_field_names` key must be a list of strings in the config file."
+        "The `custom_field_names` key must be a non-empty list of strings in the config file."
     )
     sys.exit(1)
 
@@ -95,6 +203,18 @@ if NUM_IDS is not None and (not isinstance(NUM_IDS, int) or NUM_IDS < 1):
     logging.error("`num_ids` must be a positive integer if provided.")
     sys.exit(1)
 
+if not isinstance(BATCH_FIELDS, bool):
+    logging.error("`batch_fields` must be a boolean if provided.")
+    sys.exit(1)
+
+if not isinstance(SKIP_UNCHANGED, bool):
+    logging.error("`skip_unchanged` must be a boolean if provided.")
+    sys.exit(1)
+
+if not isinstance(MAX_CONCURRENT_REQUESTS, int) or MAX_CONCURRENT_REQUESTS < 1:
+    logging.error("`max_concurrent_requests` must be a positive integer if provided.")
+    sys.exit(1)
+
 
 # --- Setup logging ---
 log_dir = Path("logs")
@@ -112,157 +232,787 @@ file_handler.setFormatter(formatter)
 tqdm_handler = TqdmLoggingHandler()
 tqdm_handler.setFormatter(formatter)
 
+# Records are queued and written by a background listener thread, keeping file
+# and terminal I/O off the request path.
+log_queue = queue.Queue(-1)
+log_listener = logging.handlers.QueueListener(log_queue, file_handler, tqdm_handler)
+log_listener.start()
+atexit.register(log_listener.stop)
+
+# The listener's handlers apply the real formatter; the queue side passes the bare message.
+queue_handler = logging.handlers.QueueHandler(log_queue)
+queue_handler.setFormatter(logging.Formatter("%(message)s"))
+
 logging.basicConfig(
     level=logging.INFO,
-    handlers=[file_handler, tqdm_handler],
+    handlers=[queue_handler],
 )
+# httpx logs every request at INFO; the PATCH loop already logs each outcome.
+logging.getLogger("httpx").setLevel(logging.WARNING)
 
-custom_field_ids = {}
-bearer_token = None
-# --- Exchange API token for Bearer token ---
-try:
-    response = requests.post(
-        f"{BASE_URL}/auth/exchange", json={"api_token": API_TOKEN, "tenant": TENANT}
+
+# --- On-disk cache for the token exchange, custom field lookup and parsed CSV ---
+# Kept in the per-user cache directory, away from the project (and its git tree).
+CACHE_DIR = (
+    Path(os.getenv("XDG_CACHE_HOME") or Path.home() / ".cache") / "custom-field-patcher"
+)
+TOKEN_TTL = 15 * 60  # seconds; used when neither `expires_in` nor a JWT `exp` is known
+CUSTOM_FIELD_IDS_TTL = 10 * 60  # seconds; revalidated with the stored ETag afterwards
+CACHE_EXPIRY_MARGIN = 60  # seconds; treat entries this close to expiry as stale
+
+
+def cache_path(kind, *key_parts, suffix=".json"):
+    key = hashlib.sha256("|".join(map(str, key_parts)).encode()).hexdigest()[:16]
+    return CACHE_DIR / f"{kind}-{key}{suffix}"
+
+
+def token_cache_path():
+    return cache_path("token", BASE_URL, TENANT, API_TOKEN)
+
+
+def custom_field_ids_cache_path():
+    # Keyed on the API token too: another token may not see the same fields.
+    return cache_path(
+        "custom-field-ids", BASE_URL, TENANT, API_TOKEN, *sorted(CUSTOM_FIELD_NAMES)
+    )
+
+
+def csv_cache_path():
+    # One file per CSV path and field list: re-reading a changed CSV overwrites it.
+    return cache_path(
+        "csv", Path(CSV_PATH).resolve(), *CUSTOM_FIELD_NAMES, suffix=".parquet"
     )
-    if response.ok:
-        logging.info(f"Successfully exchanged API token for Bearer token.")
-        bearer_token = response.json().get("access_token")
-    else:
+
+
+CSV_CACHE_STAMP_KEY = b"csv_stamp"
+
+
+def csv_cache_stamp():
+    # Stored in the Parquet metadata; a changed CSV (new mtime or size) invalidates it.
+    stat = os.stat(CSV_PATH)
+    return f"{stat.st_mtime_ns}:{stat.st_size}".encode()
+
+
+def read_cache_entry(path):
+    try:
+        return orjson.loads(path.read_bytes())
+    except (OSError, orjson.JSONDecodeError):
+        return None
+
+
+def is_fresh(entry):
+    return (
+        entry is not None
+        and time.time() < entry.get("expires_at", 0) - CACHE_EXPIRY_MARGIN
+    )
+
+
+def read_cache(path):
+    entry = read_cache_entry(path)
+    return entry.get("value") if is_fresh(entry) else None
+
+
+def write_cache(path, value, ttl, **extra):
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True, mode=0o700)
+        # Owner-only whatever the umask (it may hold a token), written to a temporary
+        # file and renamed into place.
+        partial = path.with_suffix(f"{path.suffix}.{os.getpid()}.tmp")
+        fd = os.open(partial, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as fout:
+            fout.write(
+                orjson.dumps({"value": value, "expires_at": time.time() + ttl, **extra})
+            )
+        partial.replace(path)
+    except OSError as e:
+        logging.warning(f"Failed to write cache file {path}: {e}")
+
+
+def clear_cache(path):
+    path.unlink(missing_ok=True)
+
+
+def jwt_expiry(token):
+    # Reads the `exp` claim without verifying the signature; it only sets the cache TTL.
+    try:
+        claims = token.split(".")[1]
+        claims = orjson.loads(base64.urlsafe_b64decode(claims + "=" * (-len(claims) % 4)))
+        return float(claims["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+# --- Worker threads for fetching the pages of a paginated custom field listing ---
+PAGE_FETCH_WORKERS = 8
+
+
+# --- Headers sent with every API call, set once on each client ---
+# No `Connection` header: it is implied by the pooled clients, and HTTP/2 forbids it.
+BASE_HEADERS = {
+    "Accept-Encoding": "gzip, deflate",
+    "User-Agent": "custom-field-patcher/1.0",
+}
+
+# The token-exchange body never changes during a run: serialize it once.
+AUTH_EXCHANGE_BODY = orjson.dumps({"api_token": API_TOKEN, "tenant": TENANT})
+
+
+# --- Pooled HTTP session (keep-alive + retries on transient errors) ---
+def build_session():
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=16,
+        pool_maxsize=64,
+        max_retries=Retry(
+            total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504]
+        ),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)  # e.g. a local/staging `base_url`
+    session.headers.update(BASE_HEADERS)  # `requests` already sends `Connection: keep-alive`.
+    return session
+
+
+# --- Exchange API token for Bearer token ---
+def get_bearer_token(session):
+    import requests
+
+    cached_token = read_cache(token_cache_path())
+    if cached_token:
+        logging.info("Using cached Bearer token.")
+        return cached_token
+
+    try:
+        response = session.post(
+            f"{BASE_URL}/auth/exchange",
+            data=AUTH_EXCHANGE_BODY,
+            headers={"Content-Type": "application/json"},
+        )
+        if response.ok:
+            logging.info(f"Successfully exchanged API token for Bearer token.")
+            response_json = orjson.loads(response.content)
+            bearer_token = response_json.get("access_token")
+            if bearer_token:
+                # A missing or non-numeric `expires_in` falls back to the JWT `exp`.
+                try:
+                    ttl = float(response_json.get("expires_in") or 0)
+                except (TypeError, ValueError):
+                    ttl = 0
+                if not ttl:
+                    expires_at = jwt_expiry(bearer_token)
+                    ttl = expires_at - time.time() if expires_at else TOKEN_TTL
+                write_cache(token_cache_path(), bearer_token, ttl)
+            return bearer_token
         logging.error(
             f"Failed to exchange API token for Bearer token: {response.status_code}"
         )
         sys.exit(1)
-except Exception as e:
-    logging.error(f"Error exchanging API token for Bearer token: {e}")
-    sys.exit(1)
+    except (requests.RequestException, ValueError) as e:
+        logging.error(f"Error exchanging API token for Bearer token: {e}")
+        sys.exit(1)
 
-# --- Get custom field IDs ---
-try:
-    # --- Headers for API call ---
-    headers = {
+
+def auth_headers(bearer_token):
+    return {
         "Authorization": f"Bearer {bearer_token}",
         "Content-Type": "application/json",
     }
 
+
+# --- Fetch pages 2..total_pages of a paginated listing concurrently (in page order) ---
+def fetch_remaining_pages(session, url, params, total_pages):
+    def fetch_page(page_number):
+        response = session.get(url, params={**params, "page[number]": page_number})
+        response.raise_for_status()
+        return orjson.loads(response.content)["data"]
+
+    with ThreadPoolExecutor(max_workers=PAGE_FETCH_WORKERS) as executor:
+        pages = executor.map(fetch_page, range(2, total_pages + 1))
+        return [item for page in pages for item in page]
+
+
+# --- Get custom field IDs ---
+def get_custom_field_ids(session):
+    import requests
+
+    cache_file = custom_field_ids_cache_path()
+    cached = read_cache_entry(cache_file)
+    if is_fresh(cached):
+        logging.info(f"Using cached custom field IDs for tenant {TENANT}.")
+        return cached["value"]
+
     try:
-        response = requests.get(
-            f"{BASE_URL}/api/v2/{TENANT}/custom_fields",
-            headers=headers,
-            params={"filter[target]": "use_case"},
-        )
+        url = f"{BASE_URL}/api/v2/{TENANT}/custom_fields"
+        params = {"filter[target]": "use_case"}
+        # Revalidate an expired entry: the server answers 304 if nothing changed.
+        headers = {"If-None-Match": cached["etag"]} if cached and cached.get("etag") else {}
+        response = session.get(url, params=params, headers=headers)
+        if response.status_code == 401:
+            # The cached Bearer token was rejected; drop it and exchange a fresh one.
+            logging.warning("Bearer token rejected (401). Exchanging a new one.")
+            clear_cache(token_cache_path())
+            session.headers.update(auth_headers(get_bearer_token(session)))
+            response = session.get(url, params=params, headers=headers)
+
+        if response.status_code == 304:
+            logging.info(f"Custom fields unchanged for tenant {TENANT}; using cached IDs.")
+            write_cache(
+                cache_file, cached["value"], CUSTOM_FIELD_IDS_TTL, etag=cached["etag"]
+            )
+            return cached["value"]
+
         if response.ok:  # `ok` is bool for status less than 400, NOT == 200.
             logging.info(f"Successfully fetched custom fields for tenant {TENANT}.")
 
             # --- Get custom fields (of type "use_case") for tenant ---
-            custom_fields_json_data = response.json()["data"]
+            response_json = orjson.loads(response.content)
+            custom_fields_json_data = response_json["data"]
+            total_pages = int((response_json.get("meta") or {}).get("total_pages") or 1)
+            if total_pages > 1:
+                custom_fields_json_data += fetch_remaining_pages(
+                    session, url, params, total_pages
+                )
             logging.info(
                 f"Found {len(custom_fields_json_data)} custom fields for tenant {TENANT}."
             )
 
-            # for each field name in CUSTOM_FIELD_NAMES, find the corresponding custom field id and save it in a map
-            for field_name in CUSTOM_FIELD_NAMES:
-                field_found = False
-                for item in custom_fields_json_data:
-                    if item["attributes"]["name"] == field_name:
-                        custom_field_ids[field_name] = item["id"]
-                        logging.info(
-                            f"Found custom field ID for {field_name}: {item['id']}"
-                        )
-                        field_found = True
-                        break
-                if not field_found:
-                    logging.warning(
-                        f"Custom field '{field_name}' not found for tenant {TENANT}. This field will be skipped."
-                    )
+            # Single pass: keep only the wanted names (first match wins, as before).
+            # Missing ones are reported by main().
+            wanted_names = set(CUSTOM_FIELD_NAMES)
+            custom_field_ids = {}
+            for item in custom_fields_json_data:
+                field_name = item["attributes"]["name"]
+                if field_name in wanted_names and field_name not in custom_field_ids:
+                    custom_field_ids[field_name] = item["id"]
 
             logging.info(
-                f"Found {len(custom_field_ids)} custom field IDs for tenant {TENANT} based on the CUSTOM_FIELD_NAMES list."
+                "Mapped %d/%d custom field name(s) to IDs for tenant %s.",
+                len(custom_field_ids),
+                len(CUSTOM_FIELD_NAMES),
+                TENANT,
             )
-        else:
-            logging.error(
-                f"Failed to fetch custom fields for tenant {TENANT} ({response.status_code})"
+            # A first-page ETag says nothing about later pages, so only keep it
+            # for single-page listings.
+            write_cache(
+                cache_file,
+                custom_field_ids,
+                CUSTOM_FIELD_IDS_TTL,
+                etag=response.headers.get("ETag") if total_pages == 1 else None,
             )
-            sys.exit(1)
-    except Exception as e:
+            return custom_field_ids
+        logging.error(
+            f"Failed to fetch custom fields for tenant {TENANT} ({response.status_code})"
+        )
+        sys.exit(1)
+    except (requests.RequestException, ValueError, KeyError, TypeError) as e:
         logging.error(f"Failed to fetch custom fields for tenant {TENANT}: {e}")
         sys.exit(1)
-except Exception as e:
-    logging.error(f"Error getting custom field IDs: {e}")
-    sys.exit(1)
 
-# --- Read, clean, and validate CSV ---
-try:
-    logging.info(f"Reading CSV file: {CSV_PATH}")
-    df = pd.read_csv(CSV_PATH).fillna("").rename(columns={"id": "use_case_id"})
-    required_columns = {"use_case_id", *CUSTOM_FIELD_NAMES}
-    missing = required_columns - set(df.columns)
-    if missing:
-        raise ValueError(f"Missing required column(s): {', '.join(missing)}")
-
-    if NUM_IDS:
-        df = df.head(NUM_IDS)
-        logging.info(f"Limiting to first {NUM_IDS} use case(s) as specified.")
-
-    # Force field names to be strings.
-    for field_name in CUSTOM_FIELD_NAMES:
-        try:
-            df[field_name] = df[field_name].astype(str)
-        except Exception as e:
-            logging.error(f"Failed to cast field `{field_name}` to string: {e}")
-            sys.exit(1)
 
-except Exception as e:
-    logging.error(f"Error processing CSV file: {CSV_PATH}\n{e}")
-    sys.exit(1)
+# --- Check the CSV header for required columns (before any API call or full read) ---
+def validate_csv_header():
+    try:
+        with open(CSV_PATH, newline="", encoding="utf-8-sig") as fin:
+            header = next(csv.reader(fin), [])
+        missing = {"id", *CUSTOM_FIELD_NAMES} - set(header)
+        if missing:
+            raise ValueError(f"Missing required column(s): {', '.join(missing)}")
+    except (OSError, ValueError, csv.Error) as e:
+        logging.error(f"Error processing CSV file: {CSV_PATH}\n{e}")
+        sys.exit(1)
 
-# --- Loop over each use case (row) ---
-for row_idx, row in tqdm(
-    df.iterrows(), total=len(df), desc="Patching use cases", unit="use_case"
-):
-    use_case_id = row["use_case_id"]
 
-    for field_name in CUSTOM_FIELD_NAMES:
-        # Skip if field wasn't found in the API response
-        if field_name not in custom_field_ids:
-            logging.warning(
-                f"Skipping field '{field_name}' for use case {use_case_id} - field not found in API response"
+# --- Parse the CSV into Arrow record batches of string columns (`schema`) ---
+def iter_csv_batches(schema):
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+
+    # Parse only the columns we use, and parse them straight to strings:
+    # empty cells stay "" (no NaN to fill) and no per-column casting is needed.
+    convert_options = pa_csv.ConvertOptions(
+        include_columns=schema.names,
+        column_types=schema,
+        strings_can_be_null=False,
+    )
+    # Quoted cells may span lines (free-text fields).
+    parse_options = pa_csv.ParseOptions(newlines_in_values=True)
+
+    num_rows = 0
+    try:
+        # `open_csv` streams but parses on a single thread: use it only when the
+        # read may stop early (`num_ids`) or the file is too big to hold in memory.
+        if NUM_IDS or os.path.getsize(CSV_PATH) > CSV_IN_MEMORY_MAX_BYTES:
+            reader = pa_csv.open_csv(
+                CSV_PATH, parse_options=parse_options, convert_options=convert_options
             )
+            for batch in reader:
+                num_rows += batch.num_rows
+                yield batch
+        else:
+            table = pa_csv.read_csv(
+                CSV_PATH, parse_options=parse_options, convert_options=convert_options
+            )
+            yield from table.to_batches()
+        return
+    except pa.ArrowInvalid as e:
+        # e.g. a row with fewer cells than the header, which pyarrow rejects.
+        logging.warning(
+            f"Fast CSV parser failed ({e}); reading the rest of the file with pandas."
+        )
+
+    # pandas reads short rows as before: their missing cells become "". Rows
+    # already yielded (in CSV order) are skipped, so numbering stays contiguous.
+    reader = pd.read_csv(
+        CSV_PATH,
+        usecols=schema.names,
+        dtype=str,
+        keep_default_na=False,
+        encoding="utf-8-sig",
+        chunksize=min(CSV_CHUNK_ROWS, NUM_IDS or CSV_CHUNK_ROWS),
+    )
+    for df in reader:
+        if num_rows >= len(df):
+            num_rows -= len(df)
             continue
+        df = df.iloc[num_rows:][schema.names].fillna("")
+        num_rows = 0
+        yield pa.RecordBatch.from_pandas(df, schema=schema, preserve_index=False)
+
+
+# --- Group Arrow record batches into tables of about CSV_CHUNK_ROWS rows ---
+# Stops pulling batches (i.e. parsing) once `max_rows` rows are in, if given.
+def iter_table_chunks(batches, schema, max_rows=None):
+    import pyarrow as pa
+
+    pending = []
+    pending_rows = 0
+    total_rows = 0
+    for batch in batches:
+        pending.append(batch)
+        pending_rows += batch.num_rows
+        total_rows += batch.num_rows
+        reached_limit = max_rows is not None and total_rows >= max_rows
+        if pending_rows >= CSV_CHUNK_ROWS or reached_limit:
+            yield pa.Table.from_batches(pending, schema=schema)
+            pending = []
+            pending_rows = 0
+        if reached_limit:
+            return
+    if pending:
+        yield pa.Table.from_batches(pending, schema=schema)
+
+
+# --- Read, clean, and validate CSV (yields DataFrame chunks) ---
+def read_and_prepare_csv():
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    parquet_file = None
+    writer = None
+    try:
+        parquet_cache = csv_cache_path()
+        cache_stamp = csv_cache_stamp()
+        if parquet_cache.exists():
+            try:
+                parquet_file = pq.ParquetFile(parquet_cache)
+            except (OSError, pa.ArrowException) as e:
+                # e.g. a truncated write: drop it and parse the CSV instead.
+                logging.warning(f"Discarding unreadable cache file {parquet_cache}: {e}")
+                clear_cache(parquet_cache)
+            else:
+                metadata = parquet_file.schema_arrow.metadata or {}
+                if metadata.get(CSV_CACHE_STAMP_KEY) != cache_stamp:
+                    parquet_file.close()
+                    parquet_file = None
+
+        if parquet_file:
+            logging.info(f"Reading cached CSV data: {parquet_cache}")
+            schema = parquet_file.schema_arrow
+            batches = parquet_file.iter_batches(
+                batch_size=min(CSV_CHUNK_ROWS, NUM_IDS or CSV_CHUNK_ROWS)
+            )
+        else:
+            logging.info(f"Reading CSV file: {CSV_PATH}")
+            schema = pa.schema(
+                [(column, pa.string()) for column in ["id", *CUSTOM_FIELD_NAMES]]
+            )
+            batches = iter_csv_batches(schema)
+
+            # Only a complete read is cached; it is written to a temporary file and
+            # renamed once the last chunk is in, so a partial file is never reused.
+            if not NUM_IDS:
+                # Per-process name, so concurrent runs never write the same file.
+                partial_cache = parquet_cache.with_suffix(f".parquet.{os.getpid()}.tmp")
+                try:
+                    CACHE_DIR.mkdir(parents=True, exist_ok=True, mode=0o700)
+                    writer = pq.ParquetWriter(
+                        partial_cache,
+                        schema.with_metadata({CSV_CACHE_STAMP_KEY: cache_stamp}),
+                    )
+                except OSError as e:
+                    logging.warning(f"Failed to write cache file {parquet_cache}: {e}")
+
+        if NUM_IDS:
+            logging.info(f"Limiting to first {NUM_IDS} use case(s) as specified.")
+
+        num_rows = 0
+        for table in iter_table_chunks(batches, schema, NUM_IDS):
+            if writer:
+                writer.write_table(table)
+            if NUM_IDS:
+                table = table.slice(0, NUM_IDS - num_rows)
+            num_rows += table.num_rows
+
+            # Rename on the Arrow table (metadata only) and keep the columns
+            # Arrow-backed: one conversion per chunk, no extra DataFrame copies.
+            table = table.rename_columns(
+                ["use_case_id" if name == "id" else name for name in table.column_names]
+            )
+            yield table.to_pandas(types_mapper=pd.ArrowDtype)
+
+        if writer:
+            writer.close()
+            partial_cache.chmod(0o600)
+            partial_cache.replace(parquet_cache)
+            writer = None
+    except (OSError, ValueError, pa.ArrowException) as e:
+        logging.error(f"Error processing CSV file: {CSV_PATH}\n{e}")
+        sys.exit(1)
+    finally:
+        if parquet_file:
+            parquet_file.close()
+        if writer:  # Read stopped early or failed: drop the partial cache file.
+            writer.close()
+            partial_cache.unlink(missing_ok=True)
+
+
+# --- Read at most `limit` bytes of an error body for logging ---
+async def body_preview(response, limit=ERROR_BODY_PREVIEW_BYTES):
+    preview = b""
+    async for chunk in response.aiter_bytes():
+        preview += chunk
+        if len(preview) >= limit:
+            break
+    return preview[:limit].decode("utf-8", errors="replace")
+
+
+# --- Send a single PATCH request (retrying on HTTP 429) ---
+async def patch_one(
+    client, semaphore, limiter, row_idx, use_case_id, field_name, url, payload
+):
+    import httpx
 
-        field_value = row[field_name]
-        custom_field_id = custom_field_ids[field_name]
-        url = f"{BASE_URL}/api/v2/{TENANT}/use_cases/{use_case_id}/custom_fields"
+    async with semaphore:
+        for attempt in range(MAX_RETRIES + 1):
+            await limiter.acquire()
+            try:
+                # Streamed so that a large error page is never read (or decoded) in full;
+                # leaving the block closes the response and frees its connection.
+                async with client.stream(
+                    "PATCH", url, content=orjson.dumps(payload)
+                ) as response:
+                    limiter.recalibrate(response.headers)
+                    status = response.status_code
+                    if status < 400 or status == 429:
+                        await response.aread()  # Small body; drain so the connection is reused.
+                        preview = ""
+                    else:
+                        preview = await body_preview(response)
+            except (httpx.HTTPError, httpx.InvalidURL, httpx.StreamError) as e:
+                logging.error(
+                    f"[Row {row_idx + 2}] PATCH error for use_case_id={use_case_id}, field={field_name}: {e}"
+                )
+                return
 
-        payload = {
-            "data": {
-                "type": "use_case_custom_fields",
-                "attributes": {
-                    "custom_field_id": custom_field_id,
-                    "value": field_value,
-                },
-            }
-        }
+            if status == 429 and attempt < MAX_RETRIES:
+                delay = retry_after_seconds(response.headers) + min(
+                    BACKOFF_CAP, BACKOFF_BASE * 2**attempt
+                )
+                logging.warning(
+                    f"[Row {row_idx + 2}] PATCH rate limited (429) | retrying in {delay:.1f}s"
+                )
+                await asyncio.sleep(delay)
+            elif status < 400:  # Same as `requests`' `ok`, NOT == 200.
+                logging.info(
+                    f"[Row {row_idx + 2}] PATCH success | use_case_id={use_case_id}, field={field_name}"
+                )
+                return
+            else:
+                if status == 401:
+                    # Make sure the next run exchanges a fresh Bearer token.
+                    clear_cache(token_cache_path())
+                logging.warning(
+                    f"[Row {row_idx + 2}] PATCH failed ({status}) | {preview}"
+                )
+                return
 
-        logging.info(
-            f"[Row {row_idx + 2} in CSV]"
-            f"\nWill PATCH to: {url}"
-            f"\nPayload:\n{json.dumps(payload, indent=2)}\n"
-        )
 
-        if not DRY_RUN:
-            try:
-                response = requests.patch(url, headers=headers, json=payload)
-                if response.ok:  # `ok` is bool for status less than 400, NOT == 200.
+# --- Fetch a use case's current custom field values as {custom_field_id: value} ---
+async def get_current_values(client, semaphore, limiter, url):
+    import httpx
+
+    async with semaphore:
+        await limiter.acquire()
+        try:
+            response = await client.get(url)
+            limiter.recalibrate(response.headers)
+            if response.status_code < 400:
+                data = orjson.loads(response.content)["data"]
+                return {
+                    item["attributes"]["custom_field_id"]: item["attributes"].get(
+                        "value"
+                    )
+                    for item in data
+                }
+            logging.warning(
+                f"GET current custom field values failed ({response.status_code}) | {url}"
+            )
+        except (httpx.HTTPError, httpx.InvalidURL, ValueError, KeyError, TypeError) as e:
+            logging.warning(f"GET current custom field values error for {url}: {e}")
+    return {}
+
+
+# --- Drop payload entries whose value already matches the server (None if nothing is left) ---
+def drop_unchanged(payload, current_values):
+    data = payload["data"]
+    entries = data if isinstance(data, list) else [data]
+    changed = [
+        entry
+        for entry in entries
+        if current_values.get(entry["attributes"]["custom_field_id"]) is None
+        or str(current_values[entry["attributes"]["custom_field_id"]])
+        != entry["attributes"]["value"]
+    ]
+    if not changed:
+        return None
+    return {"data": changed if isinstance(data, list) else changed[0]}
+
+
+# --- Send all PATCH requests concurrently (at most MAX_CONCURRENT_REQUESTS in flight) ---
+async def patch_all(job_chunks, headers, field_names_by_id):
+    import httpx
+
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    limiter = RateLimiter(INITIAL_REQUESTS_PER_SECOND, RATE_LIMIT_BURST)
+    # HTTP/2 multiplexes concurrent requests over a few connections (falls back to HTTP/1.1).
+    limits = httpx.Limits(
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        max_connections=MAX_CONCURRENT_REQUESTS,
+    )
+    async with httpx.AsyncClient(
+        http2=True, limits=limits, headers=headers, timeout=REQUEST_TIMEOUT
+    ) as client:
+        # The total grows chunk by chunk, as the CSV is streamed.
+        with progress_bar(
+            total=0, desc="Patching custom fields", unit="request"
+        ) as bar:
+            done = 0
+            log_every = 1
+
+            def finished():
+                nonlocal done
+                bar.update()
+                done += 1
+                # Without a visible bar (e.g. CI, redirected output), log every 5% instead.
+                if bar.disable and (done % log_every == 0 or done == bar.total):
                     logging.info(
-                        f"[Row {row_idx + 2}] PATCH success | use_case_id={use_case_id}, field={field_name}"
+                        f"Progress: {done}/{bar.total} PATCH request(s) done ({done / bar.total:.0%})."
                     )
-                else:
-                    logging.warning(
-                        f"[Row {row_idx + 2}] PATCH failed ({response.status_code}) | {response.text}"
+
+            async def run(job):
+                await patch_one(client, semaphore, limiter, *job)
+                finished()
+
+            # One GET per use case, then PATCH only the fields whose value differs.
+            async def run_use_case(use_case_jobs):
+                current_values = await get_current_values(
+                    client, semaphore, limiter, use_case_jobs[0][3]
+                )
+                changed_jobs = []
+                for row_idx, use_case_id, field_name, url, payload in use_case_jobs:
+                    payload = drop_unchanged(payload, current_values)
+                    if payload is None:
+                        logging.info(
+                            f"[Row {row_idx + 2}] PATCH skipped (unchanged) | use_case_id={use_case_id}, field={field_name}"
+                        )
+                        finished()
+                    else:
+                        # A batch may have lost some fields: name only those still sent.
+                        if isinstance(payload["data"], list):
+                            field_name = ", ".join(
+                                field_names_by_id[entry["attributes"]["custom_field_id"]]
+                                for entry in payload["data"]
+                            )
+                        changed_jobs.append(
+                            (row_idx, use_case_id, field_name, url, payload)
+                        )
+                await asyncio.gather(*(run(job) for job in changed_jobs))
+
+            for jobs in job_chunks:
+                # Concurrent PATCHes to one use case and field would race. Send only the
+                # last row's, which is the one that won when rows were sent in order.
+                # Chunks run one after another, so later chunks still win.
+                last_jobs = {}
+                for job in jobs:
+                    key = job[3], job[2]  # (url, field_name)
+                    if key in last_jobs:
+                        logging.info(
+                            f"[Row {last_jobs[key][0] + 2}] PATCH skipped (superseded by row {job[0] + 2}) | use_case_id={job[1]}, field={job[2]}"
+                        )
+                    last_jobs[key] = job
+                jobs = list(last_jobs.values())
+
+                bar.total += len(jobs)
+                bar.refresh()
+                log_every = max(1, bar.total // 20)
+
+                if SKIP_UNCHANGED:
+                    jobs_by_url = {}
+                    for job in jobs:
+                        jobs_by_url.setdefault(job[3], []).append(job)
+                    await asyncio.gather(
+                        *(
+                            run_use_case(use_case_jobs)
+                            for use_case_jobs in jobs_by_url.values()
+                        )
                     )
-            except Exception as e:
-                logging.error(
-                    f"[Row {row_idx + 2}] PATCH error for use_case_id={use_case_id}, field={field_name}: {e}"
+                else:
+                    await asyncio.gather(*(run(job) for job in jobs))
+
+
+# --- Build one PATCH job per (use case, field) for a chunk of CSV rows ---
+def build_jobs(df, row_offset, active_fields):
+    # Pull columns out as plain arrays once; indexing them is much cheaper than
+    # building a `pd.Series` per row with `df.iterrows()`.
+    use_case_ids = df["use_case_id"].to_numpy()
+    field_columns = {
+        field_name: df[field_name].to_numpy() for field_name, _ in active_fields
+    }
+
+    # URL is invariant apart from the use case ID; build the fixed parts once. (An
+    # f-string, like the other URLs: YAML may load e.g. `tenant: 12345` as an int.)
+    url_prefix = f"{BASE_URL}/api/v2/{TENANT}/use_cases/"
+    url_suffix = "/custom_fields"
+
+    # Pretty-printing every payload is only worth it when it is the output (dry-run).
+    log_payloads = DRY_RUN and logging.getLogger().isEnabledFor(logging.INFO)
+
+    jobs = []
+    for chunk_idx in range(len(df)):
+        row_idx = row_offset + chunk_idx
+        use_case_id = use_case_ids[chunk_idx]
+        url = url_prefix + use_case_id + url_suffix
+
+        # Each job keeps its own payload since requests are sent after the loop.
+        entries = [
+            (
+                field_name,
+                {
+                    "type": "use_case_custom_fields",
+                    "attributes": {
+                        "custom_field_id": custom_field_id,
+                        "value": field_columns[field_name][chunk_idx],
+                    },
+                },
+            )
+            for field_name, custom_field_id in active_fields
+        ]
+
+        # In batch mode, all fields of a use case go out in a single PATCH.
+        if BATCH_FIELDS and entries:
+            entries = [
+                (
+                    ", ".join(field_name for field_name, _ in entries),
+                    [data for _, data in entries],
+                )
+            ]
+
+        for field_name, data in entries:
+            payload = {"data": data}
+
+            if log_payloads:
+                logging.info(
+                    f"[Row {row_idx + 2} in CSV]"
+                    f"\nWill PATCH to: {url}"
+                    f"\nPayload:\n{orjson.dumps(payload, option=orjson.OPT_INDENT_2).decode()}\n"
                 )
+            else:
+                logging.info(
+                    "[Row %d in CSV] Will PATCH to: %s | field=%s",
+                    row_idx + 2,
+                    url,
+                    field_name,
+                )
+
+            jobs.append((row_idx, use_case_id, field_name, url, payload))
+
+    return jobs
+
+
+# --- Stream the CSV chunk by chunk, yielding each chunk's PATCH jobs ---
+def iter_job_chunks(active_fields):
+    row_offset = 0
+    with progress_bar(desc="Preparing use cases", unit="use_case") as bar:
+        for df in read_and_prepare_csv():
+            yield build_jobs(df, row_offset, active_fields)
+            row_offset += len(df)
+            bar.update(len(df))
+
+
+def main():
+    validate_csv_header()
+
+    session = build_session()
+    try:
+        # --- Headers for API calls (sent with every request on the session) ---
+        # `Content-Type` also covers PATCH bodies, which are pre-serialized with orjson.
+        session.headers.update(auth_headers(get_bearer_token(session)))
+
+        custom_field_ids = get_custom_field_ids(session)
+        # Read back after the lookup, which may have refreshed a stale cached token.
+        headers = {
+            key: session.headers[key]
+            for key in (*BASE_HEADERS, "Authorization", "Content-Type")
+        }
+
+        # Resolve which fields can be patched once, not per row.
+        active_fields = [
+            (field_name, custom_field_ids[field_name])
+            for field_name in CUSTOM_FIELD_NAMES
+            if field_name in custom_field_ids
+        ]
+        missing_fields = [
+            field_name
+            for field_name in CUSTOM_FIELD_NAMES
+            if field_name not in custom_field_ids
+        ]
+        if missing_fields:
+            logging.warning(
+                "Custom field(s) not found for tenant %s; skipping them for all use cases: %s",
+                TENANT,
+                ", ".join(missing_fields),
+            )
+
+        # --- Send the PATCH requests concurrently, one CSV chunk at a time ---
+        job_chunks = iter_job_chunks(active_fields)
+        if DRY_RUN:
+            for _ in job_chunks:
+                pass
+        else:
+            field_names_by_id = {
+                custom_field_id: field_name
+                for field_name, custom_field_id in active_fields
+            }
+            asyncio.run(patch_all(job_chunks, headers, field_names_by_id))
+    finally:
+        session.close()
+
 
-            time.sleep(0.5)  # Wait a bit between requests to avoid timeout.
+if __name__ == "__main__":
+    main()